@@ -1,40 +1,138 @@
 #!/usr/bin/env python3
 """
 Simple HTTP server for Trading Simulator V2
-Uses only Python standard library (no Flask required)
+Uses only Python standard library (no Flask required); orjson is used if installed
 Supports combined short + long position tracking with separate P&L metrics
 """
 
 import http.server
-import socketserver
+from http.server import ThreadingHTTPServer
 import json
 import subprocess
 import os
 import re
+import threading
 from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import attrgetter
 from dataclasses import dataclass
-from typing import List, Dict, Tuple
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+
+# orjson is optional - a much faster encoder when installed
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:
+    def _json_dumps(obj):
+        return json.dumps(obj).encode()
+    _json_loads = json.loads
 
 PORT = 3000
 SIMULATOR_BIN = "/home/gutastef/trading-simulator-v2/target/debug/trading-simulator-v2"
 UI_DIR = "/home/gutastef/trading-simulator-v2/ui"
+# Path the simulator is given for its config, which is piped in on stdin
+CONFIG_STDIN_PATH = "/dev/stdin"
+# Opt-in: keep one simulator process alive (needs the simulator's --serve mode)
+USE_SIMULATOR_WORKER = os.environ.get('SIMULATOR_WORKER') == '1'
 
-@dataclass
+# Patterns for parsing simulator output (compiled once, reused for every line).
+# Output is parsed as raw bytes, so these are bytes patterns.
+PNL_RE = re.compile(rb'P&L:\s*\$(-?[0-9,]+)')
+OPEN_LONG_RE = re.compile(rb'\| \$(\d+\.\d{2}) per barrel \(\$(\d+) total\)')
+DAY_RE = re.compile(rb'Day (\d+)')  # anchored: use .match()
+
+# Replacement that flips long premiums to negative (money spent, not received)
+OPEN_LONG_NEG = rb'| $-\1 per barrel ($-\2 total)'
+
+# Summary-line patterns, matched from the start of the line
+NET_PNL_RE = re.compile(rb'Net P&L:.*\(\$?(-?[0-9,]+) total\)')
+POSITION_COUNT_RE = re.compile(rb'Total positions opened:\s*(\d+)')
+FINAL_PRICE_RE = re.compile(rb'Final underlying price:\s*\$([0-9.]+)')
+
+# Simulator configs, filled in per run by _build_config
+# Long protection: 70DTE OTM long straddle
+LONG_CONFIG_TEMPLATE = """simulation:
+  days: {days}
+  initial_price: {initial_price:.2f}
+  drift: 0.0
+  volatility: {volatility:.2f}
+  volatility_risk_premium: {vrp:.2f}
+  seed: {seed}
+  risk_free_rate: 0.05
+  contract_multiplier: 1000
+
+strategy:
+  strategy_type: straddle
+  entry_dte: 70
+  entry_time: "15:00"
+  roll_time: "14:00"
+  strike_selection: OTM
+  strike_offset: 3.0
+  side: "long"
+  roll_triggers:
+    - trigger_type: dte
+      value: 28.0
+      legs: both
+
+strike_config:
+  tick_size: 0.25
+  roll_type: recenter
+"""
+
+# Default 1DTE short straddle
+SHORT_CONFIG_TEMPLATE = """simulation:
+  days: {days}
+  initial_price: {initial_price:.2f}
+  drift: 0.0
+  volatility: {volatility:.2f}
+  volatility_risk_premium: {vrp:.2f}
+  seed: {seed}
+  risk_free_rate: 0.05
+  contract_multiplier: 1000
+
+strategy:
+  strategy_type: straddle
+  entry_dte: 1
+  entry_time: "15:00"
+  roll_time: "14:00"
+  strike_selection: ATM
+  side: "short"
+  roll_triggers:
+    - trigger_type: time
+      value: 14.0
+      legs: both
+
+strike_config:
+  tick_size: 0.25
+  roll_type: recenter
+"""
+
+class Trade(NamedTuple):
+    """A single open/close/hold line from the simulator output"""
+    trade_type: str
+    message: str
+    day: int
+    source: str
+    pnl: Optional[int] = None  # close trades only
+
+@dataclass(frozen=True)
 class SimResult:
     """Results from a single simulation run"""
-    net_pnl: float
+    net_pnl: int
     position_count: int
     win_rate: float
     final_price: float
-    trades: List[Dict]
+    trades: Tuple[Trade, ...]
     days: int
 
 @dataclass
 class CombinedMetrics:
     """Combined metrics for short + long positions"""
-    short_pnl: float
-    long_pnl: float
-    total_pnl: float
+    short_pnl: int
+    long_pnl: int
+    total_pnl: int
     short_pnl_per_day: float
     long_pnl_per_day: float
     total_pnl_per_day: float
@@ -43,6 +141,190 @@ class CombinedMetrics:
     short_win_rate: float
     long_win_rate: float
 
+class SimulatorWorker:
+    """Long-lived simulator process reused across requests
+
+    Avoids a fork/exec and simulator start-up per run. Talks to the
+    simulator's ``--serve`` mode over a line-delimited JSON protocol: each
+    request line is ``{"config": <yaml>}`` and each response line is
+    ``{"output": <stdout of the run>}``.
+    """
+    
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [SIMULATOR_BIN, '--serve'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1
+        )
+        # One request in flight at a time - handlers share the pipes
+        self.lock = threading.Lock()
+    
+    def run(self, config_yaml):
+        """Run one simulation and return its stdout"""
+        with self.lock:
+            self.proc.stdin.write(json.dumps({'config': config_yaml}) + '\n')
+            self.proc.stdin.flush()
+            line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("Simulator worker exited unexpectedly")
+        return json.loads(line)['output']
+
+# Started in __main__ when USE_SIMULATOR_WORKER is set
+SIMULATOR_WORKER = None
+
+@lru_cache(maxsize=64)
+def run_single_strategy(days, initial_price, volatility, vrp, seed, strategy):
+    """Run a single strategy simulation
+
+    Results are cached per parameter set: the simulator is deterministic for
+    a given seed, so identical requests can skip the subprocess entirely.
+    """
+    if SIMULATOR_WORKER is not None:
+        config_yaml = _build_config(days, initial_price, volatility, vrp, seed, strategy)
+        output = SIMULATOR_WORKER.run(config_yaml)
+        if 'SIMULATION SUMMARY' not in output:
+            raise RuntimeError("Simulator worker returned an incomplete run")
+        return _build_result(output.encode().splitlines(), strategy, days)
+    
+    proc = _spawn(days, initial_price, volatility, vrp, seed, strategy)
+    return _collect(proc, strategy, days)
+
+def _build_config(days, initial_price, volatility, vrp, seed, strategy):
+    """Build the simulator YAML config for a strategy"""
+    if strategy == 'long' or strategy == 'long_protection':
+        template = LONG_CONFIG_TEMPLATE
+    else:
+        template = SHORT_CONFIG_TEMPLATE
+    return template.format(
+        days=days,
+        initial_price=initial_price,
+        volatility=volatility,
+        vrp=vrp,
+        seed=seed
+    )
+
+def _spawn(days, initial_price, volatility, vrp, seed, strategy):
+    """Start the simulator on a strategy config without waiting for it"""
+    config_yaml = _build_config(days, initial_price, volatility, vrp, seed, strategy)
+    
+    # Hand the config over through a pipe rather than a temp file - the
+    # simulator reads it from /dev/stdin, so nothing touches the disk
+    proc = subprocess.Popen(
+        [SIMULATOR_BIN, CONFIG_STDIN_PATH],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL
+    )
+    # The config is far smaller than the pipe buffer, so this never blocks
+    with proc.stdin:
+        proc.stdin.write(config_yaml.encode())
+    return proc
+
+def _collect(proc, strategy, days):
+    """Parse a spawned simulator's output as it streams, then wait for it"""
+    # Parse output line by line while the simulator is still running
+    with proc.stdout:
+        result = _build_result(proc.stdout, strategy, days)
+    # Raise on a failed run so lru_cache never stores a partial result
+    returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, proc.args)
+    return result
+
+def _build_result(lines, strategy, days):
+    """Parse simulator output lines into a SimResult"""
+    trades, net_pnl, position_count, final_price, win_rate = _scan_output(lines, strategy)
+    
+    return SimResult(
+        net_pnl=net_pnl,
+        position_count=position_count,
+        win_rate=win_rate,
+        final_price=final_price,
+        trades=tuple(trades),
+        days=days
+    )
+
+def _parse_dollars(s):
+    """Parse a whole-dollar amount like b'-6131' or b'-16,239' as an int"""
+    return int(s.replace(b',', b'')) if b',' in s else int(s)
+
+def _scan_output(lines, source=''):
+    """Parse trades and summary statistics from simulation output lines in one pass
+
+    Lines are raw bytes; only the messages kept for display are decoded.
+    """
+    trades = []
+    prefix = f"[{source}] " if source else ""
+    source_tag = source.upper()
+    is_long = 'long' in source.lower()
+    
+    close_pnl = 0
+    close_count = 0
+    wins = 0
+    summary_pnl = 0
+    position_count = 0
+    final_price = 0.0
+    
+    # Day of the current output line; roll lines ("  -> OPENED ...") carry
+    # no prefix of their own and belong to the day of the preceding close
+    day = 0
+    
+    # Bind hot-loop lookups to locals once rather than on every line
+    day_match = DAY_RE.match
+    pnl_search = PNL_RE.search
+    open_long_sub = OPEN_LONG_RE.sub
+    trades_append = trades.append
+    
+    for line in lines:
+        if line.startswith(b'Day '):
+            match = day_match(line)
+            if match:
+                day = int(match.group(1))
+        
+        if b'OPENED position' in line:
+            # Fix premium display for longs - show negative
+            msg = line.strip()
+            if is_long and b'per barrel' in msg:
+                # Change $6.13 ($6131 total) to $-6.13 ($-6131 total) for longs
+                # (money spent, not received) - both amounts in a single pass
+                msg = open_long_sub(OPEN_LONG_NEG, msg)
+            trades_append(Trade('open', prefix + msg.decode(), day, source_tag))
+        elif b'CLOSED position' in line:
+            # Realized P&L and win rate come from close trades, accumulated
+            # here so the trade list is never walked again
+            close_count += 1
+            pnl = None
+            if b'P&L:' in line:
+                match = pnl_search(line)
+                if match:
+                    pnl = _parse_dollars(match.group(1))
+                    close_pnl += pnl
+                    if pnl > 0:
+                        wins += 1
+            trades_append(Trade('close', prefix + line.strip().decode(), day, source_tag, pnl))
+        elif b'Holding pos' in line:
+            trades_append(Trade('hold', prefix + line.strip().decode(), day, source_tag))
+        elif line.startswith(b'Net P&L:'):
+            match = NET_PNL_RE.match(line)
+            if match:
+                summary_pnl = _parse_dollars(match.group(1))
+        elif line.startswith(b'Total positions opened:'):
+            match = POSITION_COUNT_RE.match(line)
+            if match:
+                position_count = int(match.group(1))
+        elif line.startswith(b'Final underlying price:'):
+            match = FINAL_PRICE_RE.match(line)
+            if match:
+                final_price = float(match.group(1))
+    
+    # Fallback to summary line if no realized P&L from trades
+    net_pnl = close_pnl if close_pnl != 0 else summary_pnl
+    win_rate = (wins / close_count) * 100.0 if close_count else 0.0
+    
+    return trades, net_pnl, position_count, final_price, win_rate
+
 class SimHandler(http.server.SimpleHTTPRequestHandler):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, directory=UI_DIR, **kwargs)
@@ -51,14 +333,20 @@ class SimHandler(http.server.SimpleHTTPRequestHandler):
         if self.path == '/run':
             content_length = int(self.headers['Content-Length'])
             post_data = self.rfile.read(content_length)
-            data = json.loads(post_data)
+            data = _json_loads(post_data)
             
-            result = self.run_simulation(data)
+            try:
+                result = self.run_simulation(data)
+            except (subprocess.CalledProcessError, RuntimeError) as e:
+                self.send_error(500, f"Simulation failed: {e}")
+                return
+            body = _json_dumps(result)
             
             self.send_response(200)
             self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
             self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+            self.wfile.write(body)
         else:
             self.send_response(404)
             self.end_headers()
@@ -72,13 +360,16 @@ class SimHandler(http.server.SimpleHTTPRequestHandler):
         strategy = data.get('strategy', 'straddle')
         
         if strategy == 'combined':
-            # Run both short and long simulations
-            short_result = self.run_single_strategy(
-                days, initial_price, volatility, vrp, seed, 'short'
-            )
-            long_result = self.run_single_strategy(
-                days, initial_price, volatility, vrp, seed, 'long'
-            )
+            # Run both short and long simulations concurrently - they are
+            # independent, so wall-clock is one run instead of two
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                short_future = pool.submit(
+                    run_single_strategy, days, initial_price, volatility, vrp, seed, 'short'
+                )
+                long_result = run_single_strategy(
+                    days, initial_price, volatility, vrp, seed, 'long'
+                )
+                short_result = short_future.result()
             
             # Calculate combined metrics
             metrics = self.calculate_combined_metrics(short_result, long_result)
@@ -91,7 +382,7 @@ class SimHandler(http.server.SimpleHTTPRequestHandler):
                 'position_count': metrics.short_positions + metrics.long_positions,
                 'win_rate': (metrics.short_win_rate + metrics.long_win_rate) / 2,
                 'final_price': short_result.final_price,
-                'trades': all_trades,
+                'trades': [t._asdict() for t in all_trades],
                 # New combined metrics
                 'short_pnl': metrics.short_pnl,
                 'long_pnl': metrics.long_pnl,
@@ -105,7 +396,7 @@ class SimHandler(http.server.SimpleHTTPRequestHandler):
             }
         else:
             # Single strategy (backward compatible)
-            result = self.run_single_strategy(
+            result = run_single_strategy(
                 days, initial_price, volatility, vrp, seed, strategy
             )
             
@@ -116,7 +407,7 @@ class SimHandler(http.server.SimpleHTTPRequestHandler):
                 'position_count': result.position_count,
                 'win_rate': result.win_rate,
                 'final_price': result.final_price,
-                'trades': result.trades,
+                'trades': [t._asdict() for t in result.trades],
                 'short_pnl': result.net_pnl if strategy != 'long_protection' else 0,
                 'long_pnl': result.net_pnl if strategy == 'long_protection' else 0,
                 'short_pnl_per_day': pnl_per_day if strategy != 'long_protection' else 0,
@@ -128,94 +419,6 @@ class SimHandler(http.server.SimpleHTTPRequestHandler):
                 'long_win_rate': result.win_rate if strategy == 'long_protection' else 0,
             }
     
-    def run_single_strategy(self, days, initial_price, volatility, vrp, seed, strategy):
-        """Run a single strategy simulation"""
-        
-        if strategy == 'long' or strategy == 'long_protection':
-            config_yaml = f"""simulation:
-  days: {days}
-  initial_price: {initial_price:.2f}
-  drift: 0.0
-  volatility: {volatility:.2f}
-  volatility_risk_premium: {vrp:.2f}
-  seed: {seed}
-  risk_free_rate: 0.05
-  contract_multiplier: 1000
-
-strategy:
-  strategy_type: straddle
-  entry_dte: 70
-  entry_time: "15:00"
-  roll_time: "14:00"
-  strike_selection: OTM
-  strike_offset: 3.0
-  side: "long"
-  roll_triggers:
-    - trigger_type: dte
-      value: 28.0
-      legs: both
-
-strike_config:
-  tick_size: 0.25
-  roll_type: recenter
-"""
-        else:
-            # Default 1DTE short straddle
-            config_yaml = f"""simulation:
-  days: {days}
-  initial_price: {initial_price:.2f}
-  drift: 0.0
-  volatility: {volatility:.2f}
-  volatility_risk_premium: {vrp:.2f}
-  seed: {seed}
-  risk_free_rate: 0.05
-  contract_multiplier: 1000
-
-strategy:
-  strategy_type: straddle
-  entry_dte: 1
-  entry_time: "15:00"
-  roll_time: "14:00"
-  strike_selection: ATM
-  side: "short"
-  roll_triggers:
-    - trigger_type: time
-      value: 14.0
-      legs: both
-
-strike_config:
-  tick_size: 0.25
-  roll_type: recenter
-"""
-        
-        # Write config file
-        config_path = f"/tmp/sim_config_{strategy}.yaml"
-        with open(config_path, 'w') as f:
-            f.write(config_yaml)
-        
-        # Run simulation
-        result = subprocess.run(
-            [SIMULATOR_BIN, config_path],
-            capture_output=True,
-            text=True
-        )
-        
-        stdout = result.stdout
-        
-        # Parse output
-        trades = self.parse_trades(stdout, strategy)
-        net_pnl, position_count, final_price = self.extract_summary(stdout, trades, strategy)
-        win_rate = self.calculate_win_rate(trades)
-        
-        return SimResult(
-            net_pnl=net_pnl,
-            position_count=position_count,
-            win_rate=win_rate,
-            final_price=final_price,
-            trades=trades,
-            days=days
-        )
-    
     def calculate_combined_metrics(self, short: SimResult, long: SimResult) -> CombinedMetrics:
         """Calculate combined metrics from short and long results"""
         
@@ -235,115 +438,25 @@ strike_config:
             long_win_rate=long.win_rate,
         )
     
-    def merge_trades(self, short_trades: List[Dict], long_trades: List[Dict]) -> List[Dict]:
+    def merge_trades(self, short_trades: Sequence[Trade], long_trades: Sequence[Trade]) -> List[Trade]:
         """Merge trades from short and long strategies, sorted by day"""
         
-        # Add prefix to distinguish trade sources
-        for t in short_trades:
-            t['source'] = 'SHORT'
-        for t in long_trades:
-            t['source'] = 'LONG'
-        
-        # Combine and sort by extracting day number from message
-        all_trades = short_trades + long_trades
-        
-        def extract_day(trade):
-            match = re.search(r'Day\s+(\d+)', trade['message'])
-            return int(match.group(1)) if match else 0
-        
-        all_trades.sort(key=extract_day)
+        # Trades already carry their source (SHORT/LONG) from parsing;
+        # combine and sort by the day recorded at parse time
+        all_trades = [*short_trades, *long_trades]
+        all_trades.sort(key=attrgetter('day'))
         return all_trades
     
-    def parse_trades(self, output, source=''):
-        """Parse trades from simulation output and fix display for longs"""
-        trades = []
-        prefix = f"[{source}] " if source else ""
-        is_long = 'long' in source.lower()
-        
-        for line in output.split('\n'):
-            if 'OPENED position' in line or '-> OPENED position' in line:
-                # Fix premium display for longs - show negative
-                msg = line.strip()
-                if is_long:
-                    # Change $6.13 to $-6.13 for longs (money spent, not received)
-                    # Match the premium amount after the pipe and before "per barrel"
-                    msg = re.sub(r'\| \$(\d+\.\d{2}) per barrel', r'| $-\1 per barrel', msg)
-                    msg = re.sub(r'\(\$(\d+) total\)', r'($-\1 total)', msg)
-                trades.append({
-                    'trade_type': 'open',
-                    'message': prefix + msg
-                })
-            elif 'CLOSED position' in line:
-                trades.append({
-                    'trade_type': 'close', 
-                    'message': prefix + line.strip()
-                })
-            elif 'Holding pos' in line:
-                trades.append({
-                    'trade_type': 'hold',
-                    'message': prefix + line.strip()
-                })
-        return trades
-    
-    def calculate_win_rate(self, trades):
-        """Calculate win rate from close trades"""
-        close_trades = [t for t in trades if t['trade_type'] == 'close']
-        if not close_trades:
-            return 0.0
-        
-        wins = 0
-        for t in close_trades:
-            match = re.search(r'P&L:\s*\$(-?[0-9,]+)', t['message'])
-            if match:
-                pnl = float(match.group(1).replace(',', ''))
-                if pnl > 0:
-                    wins += 1
-        
-        return (wins / len(close_trades)) * 100.0
-    
-    def extract_summary(self, output, trades=None, strategy=''):
-        """Extract summary statistics from simulation output"""
-        # Calculate P&L from close trades - this is the correct realized P&L
-        net_pnl = 0.0
-        if trades:
-            for t in trades:
-                if t['trade_type'] == 'close':
-                    match = re.search(r'P&L:\s*\$(-?[0-9,]+)', t['message'])
-                    if match:
-                        net_pnl += float(match.group(1).replace(',', ''))
-        
-        # Fallback to summary line if no trades
-        if net_pnl == 0.0:
-            for line in output.split('\n'):
-                if 'Net P&L:' in line:
-                    match = re.search(r'\(\$?(-?[0-9,]+) total\)', line)
-                    if match:
-                        net_pnl = float(match.group(1).replace(',', ''))
-        
-        position_count = 0
-        final_price = 0.0
-        
-        for line in output.split('\n'):
-            if 'Total positions opened:' in line:
-                parts = line.split(':')
-                if len(parts) > 1:
-                    try:
-                        position_count = int(parts[1].strip())
-                    except:
-                        pass
-            
-            if 'Final underlying price:' in line:
-                match = re.search(r'\$([0-9.]+)', line)
-                if match:
-                    final_price = float(match.group(1))
-        
-        return net_pnl, position_count, final_price
-
 if __name__ == '__main__':
     print("🚀 Trading Simulator Web Server starting...")
     print("📱 Open http://localhost:3000 in your browser")
     print("")
     
-    socketserver.TCPServer.allow_reuse_address = True
-    with socketserver.TCPServer(("127.0.0.1", PORT), SimHandler) as httpd:
+    if USE_SIMULATOR_WORKER:
+        SIMULATOR_WORKER = SimulatorWorker()
+    
+    # Threaded so a running simulation doesn't block other requests; the
+    # result cache and simulator worker are safe to share across threads
+    ThreadingHTTPServer.allow_reuse_address = True
+    with ThreadingHTTPServer(("127.0.0.1", PORT), SimHandler) as httpd:
         httpd.serve_forever()